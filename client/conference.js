@@ -513,8 +513,9 @@ class ConferenceClient {
             };
 
             this.ws.onmessage = async (event) => {
-                const message = JSON.parse(event.data);
-                await this.handleSignalingMessage(message);
+                for (const message of this.unpackSignalingFrame(event.data)) {
+                    await this.handleSignalingMessage(message);
+                }
             };
 
             this.ws.onerror = (error) => {
@@ -531,8 +532,8 @@ class ConferenceClient {
 
             // Resolve when registered
             const checkRegistered = (event) => {
-                const msg = JSON.parse(event.data);
-                if (msg.type === 'registered') {
+                const messages = this.unpackSignalingFrame(event.data);
+                if (messages.some(msg => msg.type === 'registered')) {
                     this.ws.removeEventListener('message', checkRegistered);
                     this.updateStatus('Connected', 'connected');
                     resolve();
@@ -542,6 +543,12 @@ class ConferenceClient {
         });
     }
 
+    unpackSignalingFrame(data) {
+        // The server coalesces queued messages into one batch frame
+        const message = JSON.parse(data);
+        return message.type === 'batch' ? message.msgs : [message];
+    }
+
     async handleSignalingMessage(message) {
         console.log('Received:', message);
 
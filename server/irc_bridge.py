@@ -5,32 +5,63 @@ Bridges chat messages between WebRTC rooms and IRC channels
 """
 
 import asyncio
+import functools
 import ssl
 import logging
-from typing import Dict, Callable, Optional
+from typing import Dict, Callable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Outgoing lines buffered for the sender task before new ones are dropped
+IRC_OUTBOUND_QUEUE_SIZE = 1024
+
+# Most queued lines the sender coalesces into one socket write
+IRC_MAX_BATCH_SIZE = 64
+
+# Longest partial line kept between reads; IRC lines are at most 512 bytes
+# (8 KiB with message tags), so anything longer is garbage to skip
+IRC_MAX_LINE_BUFFER = 8192
+
+
+@functools.lru_cache(maxsize=1)
+def _irc_ssl_context() -> ssl.SSLContext:
+    """Build the client SSL context once, since loading the CA bundle is expensive."""
+    return ssl.create_default_context()
+
 
 class IRCBridge:
     """Bridge between WebRTC chat and IRC."""
 
     def __init__(self, server: str = "irc.blcknd.network", port: int = 6697,
-                 nickname: str = "webrtc-bridge", use_ssl: bool = True):
+                 nickname: str = "webrtc-bridge", use_ssl: bool = True,
+                 auto_reconnect: bool = False):
         self.server = server
         self.port = port
         self.nickname = nickname
+        self._nickname_bytes = nickname.encode('utf-8')
         self.use_ssl = use_ssl
+        self.auto_reconnect = auto_reconnect
 
         self.reader: Optional[asyncio.StreamReader] = None
         self.writer: Optional[asyncio.StreamWriter] = None
         self.connected = False
 
+        # Background reconnection after the connection drops
+        self.reconnect_task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        # Channel traffic is queued here and written by a single sender task,
+        # so callers never wait on the IRC socket
+        self.outq: asyncio.Queue = asyncio.Queue(maxsize=IRC_OUTBOUND_QUEUE_SIZE)
+        self.sender_task: Optional[asyncio.Task] = None
+
         # Callbacks for receiving messages from IRC
         self.message_callbacks: Dict[str, Callable] = {}
 
         # Channel mappings: {webrtc_room: irc_channel}
         self.room_channels: Dict[str, str] = {}
+        # Reverse channel mappings: {irc_channel: webrtc_room}
+        self.channel_rooms: Dict[str, str] = {}
 
     async def connect(self):
         """Connect to IRC server."""
@@ -39,8 +70,7 @@ class IRCBridge:
             logger.info(f"SSL enabled: {self.use_ssl}")
 
             if self.use_ssl:
-                logger.info("Creating SSL context...")
-                ssl_context = ssl.create_default_context()
+                ssl_context = _irc_ssl_context()
                 logger.info("Opening SSL connection...")
                 self.reader, self.writer = await asyncio.wait_for(
                     asyncio.open_connection(self.server, self.port, ssl=ssl_context),
@@ -55,11 +85,16 @@ class IRCBridge:
 
             logger.info("✓ TCP connection established")
 
+            # No userspace write buffering: drain() then only waits while the
+            # kernel has not yet accepted the data
+            self.writer.transport.set_write_buffer_limits(0)
+
             # Send IRC registration
-            logger.info(f"Sending NICK {self.nickname}")
-            await self.send_raw(f"NICK {self.nickname}")
-            logger.info(f"Sending USER registration")
-            await self.send_raw(f"USER {self.nickname} 0 * :WebRTC Bridge Bot")
+            logger.info(f"Sending NICK {self.nickname} and USER registration")
+            await self.send_many([
+                f"NICK {self.nickname}",
+                f"USER {self.nickname} 0 * :WebRTC Bridge Bot"
+            ])
 
             # Wait for connection to be established
             logger.info("Waiting for IRC welcome message...")
@@ -71,6 +106,9 @@ class IRCBridge:
             # Start message listener
             asyncio.create_task(self._message_listener())
 
+            if self.sender_task is None or self.sender_task.done():
+                self.sender_task = asyncio.create_task(self._sender_loop())
+
         except asyncio.TimeoutError:
             logger.error(f"Timeout connecting to IRC server {self.server}:{self.port}")
             raise ConnectionError(f"Timeout connecting to {self.server}:{self.port}")
@@ -89,15 +127,15 @@ class IRCBridge:
             if not line:
                 raise ConnectionError("IRC connection closed during registration")
 
-            message = line.decode('utf-8', errors='ignore').strip()
+            line = line.strip()
+            message = line.decode('utf-8', errors='ignore')
             message_count += 1
             logger.info(f"IRC << [{message_count}] {message}")
 
             # Respond to PING
-            if message.startswith("PING"):
-                pong = message.replace("PING", "PONG")
+            if line.startswith(b'PING'):
                 logger.info(f"IRC >> PONG")
-                await self.send_raw(pong)
+                await self._send_pong(line)
 
             # Check for welcome message (001) or end of MOTD (376)
             if " 001 " in message:
@@ -112,34 +150,106 @@ class IRCBridge:
 
     async def send_raw(self, message: str):
         """Send raw IRC message."""
+        # The writer is dropped as soon as the connection is lost, so sends
+        # while disconnected are a cheap no-op rather than a raised error
+        if self.writer:
+            await self._write(f"{message}\r\n".encode('utf-8'))
+
+    async def send_many(self, messages: List[str]):
+        """Send several raw IRC messages with a single write."""
+        if self.writer and messages:
+            await self._write("".join(f"{message}\r\n" for message in messages).encode('utf-8'))
+
+    def queue_raw(self, message: str):
+        """Queue a raw IRC message for the sender task without waiting."""
+        # Like send_raw, traffic while disconnected is silently dropped
+        if not self.writer:
+            return
+        try:
+            self.outq.put_nowait(f"{message}\r\n")
+        except asyncio.QueueFull:
+            logger.warning("IRC outbound queue full, dropping message")
+
+    async def _sender_loop(self):
+        """Drain queued lines onto the socket, coalescing whatever is waiting."""
+        while True:
+            lines = [await self.outq.get()]
+            while len(lines) < IRC_MAX_BATCH_SIZE and not self.outq.empty():
+                lines.append(self.outq.get_nowait())
+            if self.writer:
+                await self._write("".join(lines).encode('utf-8'))
+
+    async def _send_pong(self, ping: bytes):
+        """Answer a raw PING line by echoing its token back in a PONG."""
         if self.writer:
-            self.writer.write(f"{message}\r\n".encode('utf-8'))
-            await self.writer.drain()
+            await self._write(b'PONG' + ping[4:] + b'\r\n')
 
-    async def join_channel(self, channel: str, room_id: str):
+    async def _write(self, data: bytes):
+        """Write to the socket, only waiting for it to flush if data is still pending."""
+        try:
+            self.writer.write(data)
+            if self.writer.transport.get_write_buffer_size() > 0:
+                await self.writer.drain()
+        except (ConnectionError, OSError) as e:
+            logger.error(f"IRC write failed: {e}")
+            self._connection_lost()
+
+    def _connection_lost(self):
+        """Mark the connection as dead and schedule a reconnect if enabled."""
+        self.connected = False
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+        if self.auto_reconnect and not self._closing and (
+                self.reconnect_task is None or self.reconnect_task.done()):
+            self.reconnect_task = asyncio.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        """Reconnect with exponential backoff and rejoin mapped channels."""
+        delay = 1.0
+        while not self._closing:
+            logger.info(f"Reconnecting to IRC in {delay:.0f}s...")
+            await asyncio.sleep(delay)
+            try:
+                await self.connect()
+            except Exception:
+                delay = min(delay * 2, 300.0)
+                continue
+
+            channels = list(self.channel_rooms)
+            if channels:
+                await self.send_many([f"JOIN {channel}" for channel in channels])
+                logger.info(f"✓ Rejoined IRC channels: {', '.join(channels)}")
+            return
+
+    def join_channel(self, channel: str, room_id: str):
         """Join an IRC channel and map it to a WebRTC room."""
         if not channel.startswith('#'):
             channel = f"#{channel}"
 
         logger.info(f"Joining IRC channel {channel} for room {room_id}...")
-        await self.send_raw(f"JOIN {channel}")
+        self.queue_raw(f"JOIN {channel}")
         self.room_channels[room_id] = channel
+        self.channel_rooms[channel] = room_id
         logger.info(f"✓ Joined IRC channel {channel} for room {room_id}")
 
-    async def leave_channel(self, room_id: str):
+    def leave_channel(self, room_id: str):
         """Leave an IRC channel."""
         if room_id in self.room_channels:
             channel = self.room_channels[room_id]
-            await self.send_raw(f"PART {channel}")
+            self.queue_raw(f"PART {channel}")
             del self.room_channels[room_id]
+            if self.channel_rooms.get(channel) == room_id:
+                del self.channel_rooms[channel]
             logger.info(f"Left IRC channel {channel}")
 
-    async def send_message(self, room_id: str, username: str, message: str):
+    def send_message(self, room_id: str, username: str, message: str):
         """Send message from WebRTC user to IRC channel."""
         if room_id in self.room_channels:
             channel = self.room_channels[room_id]
             formatted = f"<{username}> {message}"
-            await self.send_raw(f"PRIVMSG {channel} :{formatted}")
+            self.queue_raw(f"PRIVMSG {channel} :{formatted}")
 
     def register_message_callback(self, room_id: str, callback: Callable):
         """Register callback for receiving IRC messages for a room."""
@@ -147,66 +257,112 @@ class IRCBridge:
 
     async def _message_listener(self):
         """Listen for messages from IRC."""
+        buffer = b''
+        # Set after an oversized line is dropped, until its end is seen
+        resync = False
         try:
             while self.connected:
-                line = await self.reader.readline()
-                if not line:
+                chunk = await self.reader.read(8192)
+                if not chunk:
                     logger.warning("IRC connection closed")
-                    self.connected = False
+                    self._connection_lost()
                     break
 
-                message = line.decode('utf-8', errors='ignore').strip()
-                logger.debug(f"IRC: {message}")
+                if resync:
+                    end = chunk.find(b'\n')
+                    if end < 0:
+                        continue
+                    chunk = chunk[end + 1:]
+                    resync = False
 
-                # Respond to PING
-                if message.startswith("PING"):
-                    pong = message.replace("PING", "PONG")
-                    await self.send_raw(pong)
-                    continue
+                # Handle every complete line from this read in one wakeup;
+                # a trailing partial line stays buffered for the next read
+                *lines, buffer = (buffer + chunk).split(b'\n')
+                for line in lines:
+                    await self._handle_line(line.strip())
 
-                # Parse PRIVMSG
-                if " PRIVMSG " in message:
-                    await self._handle_privmsg(message)
+                if len(buffer) > IRC_MAX_LINE_BUFFER:
+                    logger.warning("Dropping oversized IRC line (%d bytes so far)", len(buffer))
+                    buffer = b''
+                    resync = True
 
         except Exception as e:
             logger.error(f"Error in IRC message listener: {e}")
-            self.connected = False
-
-    async def _handle_privmsg(self, message: str):
+            self._connection_lost()
+
+    async def _handle_line(self, line: bytes):
+        """Handle a single raw line from IRC."""
+        logger.debug("IRC: %r", line)
+
+        # Respond to PING
+        if line.startswith(b'PING'):
+            await self._send_pong(line)
+            return
+
+        # Parse PRIVMSG
+        privmsg = self._parse_privmsg(line)
+        if privmsg:
+            await self._handle_privmsg(*privmsg)
+
+    @staticmethod
+    def _parse_privmsg(line: bytes) -> Optional[Tuple[bytes, bytes, bytes]]:
+        """Split a raw PRIVMSG line into undecoded (nick, channel, message) slices.
+
+        Works on the bytes in a single pass; decoding is left to the caller so
+        it only happens for messages that are actually delivered. Returns None
+        if the line is not a PRIVMSG.
+        """
+        # Format: :nick!user@host PRIVMSG #channel :message
+        if not line.startswith(b':'):
+            return None
+
+        prefix_end = line.find(b' ')
+        if prefix_end < 0:
+            return None
+
+        command_start = prefix_end + 1
+        if line[command_start:command_start + 8] != b'PRIVMSG ':
+            return None
+
+        channel_start = command_start + 8
+        channel_end = line.find(b' :', channel_start)
+        if channel_end < 0:
+            return None
+
+        nick_end = line.find(b'!', 1, prefix_end)
+        if nick_end < 0:
+            nick_end = prefix_end
+
+        return line[1:nick_end], line[channel_start:channel_end], line[channel_end + 2:]
+
+    async def _handle_privmsg(self, nick: bytes, channel: bytes, body: bytes):
         """Handle PRIVMSG from IRC."""
         try:
-            # Format: :nick!user@host PRIVMSG #channel :message
-            parts = message.split(" PRIVMSG ", 1)
-            if len(parts) != 2:
-                return
-
-            nick_part = parts[0][1:].split("!")[0]  # Extract nickname
-            rest = parts[1].split(" :", 1)
-            if len(rest) != 2:
-                return
-
-            channel = rest[0]
-            msg_content = rest[1]
-
             # Don't echo our own messages
-            if nick_part == self.nickname:
+            if nick == self._nickname_bytes:
                 return
 
             # Find which room this channel belongs to
-            for room_id, mapped_channel in self.room_channels.items():
-                if mapped_channel == channel:
-                    if room_id in self.message_callbacks:
-                        await self.message_callbacks[room_id](nick_part, msg_content)
-                    break
+            room_id = self.channel_rooms.get(channel.decode('utf-8', errors='replace'))
+            callback = self.message_callbacks.get(room_id)
+            if callback:
+                await callback(nick.decode('utf-8', errors='replace'),
+                               body.decode('utf-8', errors='replace'))
 
         except Exception as e:
             logger.error(f"Error handling IRC PRIVMSG: {e}")
 
     async def disconnect(self):
         """Disconnect from IRC."""
+        self._closing = True
+        if self.reconnect_task:
+            self.reconnect_task.cancel()
+        if self.sender_task:
+            self.sender_task.cancel()
         if self.writer:
+            writer = self.writer
             await self.send_raw("QUIT :WebRTC Bridge disconnecting")
-            self.writer.close()
-            await self.writer.wait_closed()
+            writer.close()
+            await writer.wait_closed()
         self.connected = False
         logger.info("Disconnected from IRC")
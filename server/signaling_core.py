@@ -0,0 +1,1176 @@
+"""
+Shared WebRTC Signaling Server Core
+Multi-participant rooms, password protection, moderation and IRC chat bridge,
+with each feature switched on or off by a Config. signaling_server_v2.py and
+signaling_server_local.py are thin entry points around this module.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import ssl
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+import orjson
+import websockets
+from websockets.server import WebSocketServerProtocol
+from irc_bridge import IRCBridge
+import functools
+import hashlib
+import hmac
+from pathlib import Path
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class Config:
+    """Feature switches for a signaling server deployment."""
+    use_ssl: bool = True  # Serve wss:// with certificates from find_ssl_certificates()
+    enable_irc: bool = True  # Bridge rooms that name an IRC channel
+    hash_passwords: bool = True  # Store room passwords as digests rather than plaintext
+    moderation: bool = True  # Room creators become moderators (kick, ban, rename, promote)
+    host: str = "0.0.0.0"
+    port: int = 8765
+
+
+@dataclass(slots=True)
+class ClientInfo:
+    """State kept for each registered connection."""
+    id: str
+    username: str
+    websocket: WebSocketServerProtocol
+    outq: asyncio.Queue
+    writer_task: asyncio.Task
+    room: Optional[str] = None
+    dropped: bool = False
+
+
+@dataclass(slots=True)
+class Room:
+    """State kept for each active room."""
+    members: Dict[str, ClientInfo] = field(default_factory=dict)  # Keyed by client ID
+    password: Optional[str] = None
+    irc_channel: Optional[str] = None
+    moderator: Optional[str] = None
+    banned: OrderedDict[str, None] = field(default_factory=OrderedDict)  # Banned client IDs, oldest first
+    joined_prefix: str = ''  # Fixed fields of room-joined; rebuild if the ones above it change
+
+
+# Active configuration, set by serve_signaling()
+config = Config()
+
+# Store connected clients: {websocket: ClientInfo}
+clients: Dict[WebSocketServerProtocol, ClientInfo] = {}
+
+# Index of connected clients by ID: {client_id: websocket}
+id_to_ws: Dict[str, WebSocketServerProtocol] = {}
+
+# Store rooms: {room_id: Room}
+rooms: Dict[str, Room] = {}
+
+# Per-client cap on queued outbound messages before the client is dropped
+OUTBOUND_QUEUE_SIZE = 256
+
+# Most queued messages the writer folds into one batch frame
+MAX_BATCH_SIZE = 32
+
+# Recipients queued per slice before a large-room broadcast yields
+BROADCAST_BATCH_SIZE = 50
+
+# Bans kept per room; the oldest is forgotten once the list is full
+MAX_BANNED_PER_ROOM = 1024
+
+# Key for room password digests; set ROOM_SALT (up to 64 bytes) to keep
+# digests stable across restarts, otherwise a fresh key is drawn per process
+ROOM_SALT = os.environ.get('ROOM_SALT', '').encode() or os.urandom(16)
+
+# Pre-built envelopes for relayed WebRTC signaling messages, chat and presence
+_RELAY_TMPLS = {
+    msg_type: '{"type":"%s","senderId":%%s,"data":%%s}' % msg_type
+    for msg_type in ('offer', 'answer', 'ice-candidate')
+}
+_RELAY_TYPES = frozenset(_RELAY_TMPLS)
+_CHAT_TMPL = '{"type":"chat-message","username":%s,"message":%s,"timestamp":%s}'
+_USER_JOINED_TMPL = '{"type":"user-joined","clientId":%s,"username":%s}'
+_USER_LEFT_TMPL = '{"type":"user-left","clientId":%s,"username":%s}'
+_ROOM_JOINED_PREFIX_TMPL = '{"type":"room-joined","roomId":%s,"hasPassword":%s,"ircChannel":%s,"moderatorId":%s,'
+
+# IRC bridge instance
+irc_bridge: Optional[IRCBridge] = None
+
+# Parsed certificate details: {cert_path: (mtime, details)}
+_cert_cache: Dict[str, Tuple[float, dict]] = {}
+
+# Fire-and-forget tasks, kept referenced until they finish so they aren't
+# garbage-collected mid-flight
+_background_tasks: Set[asyncio.Task] = set()
+
+
+async def init_irc_bridge():
+    """Initialize IRC bridge connection on-demand."""
+    global irc_bridge
+
+    # Only initialize if not already connected
+    # Check both existence AND connection status
+    if irc_bridge is not None and irc_bridge.connected:
+        return True
+
+    # A dropped bridge retries on its own; replacing it would lose the
+    # channel mappings and callbacks of every other bridged room
+    if irc_bridge_reconnecting():
+        logger.info("IRC bridge is reconnecting, not replacing it")
+        return False
+
+    # Stop a stale bridge's background reconnection before replacing it
+    if irc_bridge is not None:
+        await irc_bridge.disconnect()
+
+    try:
+        logger.info("Initializing IRC bridge (on-demand)...")
+        logger.info("IRC server: irc.blcknd.network:6697 (SSL)")
+        irc_bridge = IRCBridge(
+            server="irc.blcknd.network",
+            port=6697,
+            nickname="webrtc",
+            use_ssl=True,
+            auto_reconnect=True
+        )
+        logger.info("Attempting to connect to IRC server...")
+        await irc_bridge.connect()
+        logger.info("✓ IRC bridge connected successfully")
+        return True
+    except ConnectionError as e:
+        logger.error(f"✗ IRC connection error: {e}")
+        await _discard_irc_bridge()
+        return False
+    except TimeoutError as e:
+        logger.error(f"✗ IRC connection timeout: {e}")
+        await _discard_irc_bridge()
+        return False
+    except Exception as e:
+        logger.error(f"✗ Failed to initialize IRC bridge: {type(e).__name__}: {e}")
+        import traceback
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        await _discard_irc_bridge()
+        return False
+
+
+async def _discard_irc_bridge():
+    """Tear down a bridge that failed to connect so it stops reconnecting."""
+    global irc_bridge
+
+    bridge, irc_bridge = irc_bridge, None
+    try:
+        await bridge.disconnect()
+    except Exception as e:
+        logger.warning(f"Error closing failed IRC bridge: {e}")
+
+
+def irc_bridge_reconnecting() -> bool:
+    """Whether the IRC bridge lost its connection and is retrying in the background."""
+    return (irc_bridge is not None and irc_bridge.reconnect_task is not None
+            and not irc_bridge.reconnect_task.done())
+
+
+def irc_bridge_available() -> bool:
+    """Whether rooms can be mapped onto the IRC bridge now or once it reconnects."""
+    return irc_bridge is not None and (irc_bridge.connected or irc_bridge_reconnecting())
+
+
+@functools.lru_cache(maxsize=256)
+def hash_password(password: str) -> str:
+    """Hash password for storage."""
+    # Keyed so stored digests can't be matched against precomputed tables;
+    # cached so repeated join attempts on a room skip re-hashing
+    return hashlib.blake2b(password.encode(), key=ROOM_SALT, digest_size=16).hexdigest()
+
+
+def stored_password(password: str) -> str:
+    """Return a room password in the form it is stored and compared in."""
+    return hash_password(password) if config.hash_passwords else password
+
+
+@functools.lru_cache(maxsize=1)
+def server_ssl_context(cert_path: str, key_path: str) -> ssl.SSLContext:
+    """Build the WSS context once per certificate pair, since loading the chain is expensive."""
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(cert_path, key_path)
+    # Forward-secret AEAD suites only for TLS 1.2; TLS 1.3 suites are unaffected
+    ssl_context.set_ciphers('ECDHE+AESGCM:ECDHE+CHACHA20')
+    ssl_context.options |= ssl.OP_NO_COMPRESSION
+    return ssl_context
+
+
+def _load_certificate_details(cert_path: str) -> dict:
+    """Parse an SSL certificate and extract the details worth logging."""
+    # Only wss deployments get here; plain-ws dev servers don't need cryptography
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+
+    with open(cert_path, 'rb') as f:
+        cert_data = f.read()
+        cert = x509.load_pem_x509_certificate(cert_data, default_backend())
+
+    # Extract domain names
+    domains = []
+    try:
+        # Get Common Name
+        cn = cert.subject.get_attributes_for_oid(x509.oid.NameOID.COMMON_NAME)[0].value
+        domains.append(cn)
+    except (IndexError, AttributeError):
+        pass
+
+    # Get Subject Alternative Names
+    try:
+        san_ext = cert.extensions.get_extension_for_oid(x509.oid.ExtensionOID.SUBJECT_ALTERNATIVE_NAME)
+        san_domains = [name.value for name in san_ext.value]
+        domains.extend([d for d in san_domains if d not in domains])
+    except x509.ExtensionNotFound:
+        pass
+
+    # Get issuer
+    try:
+        issuer = cert.issuer.get_attributes_for_oid(x509.oid.NameOID.COMMON_NAME)[0].value
+    except (IndexError, AttributeError):
+        issuer = "Unknown"
+
+    # Get expiration info
+    # cryptography >= 42 exposes timezone-aware validity dates
+    if hasattr(cert, 'not_valid_before_utc'):
+        not_before, not_after = cert.not_valid_before_utc, cert.not_valid_after_utc
+    else:
+        not_before, not_after = cert.not_valid_before, cert.not_valid_after
+
+    return {
+        'issuer': issuer,
+        'domains': domains,
+        'not_before': not_before,
+        'not_after': not_after
+    }
+
+
+def log_certificate_info(cert_path: str):
+    """Log detailed information about an SSL certificate."""
+    try:
+        # Reuse the parsed details unless the file changed since last time
+        mtime = os.path.getmtime(cert_path)
+        cached = _cert_cache.get(cert_path)
+        if cached and cached[0] == mtime:
+            details = cached[1]
+        else:
+            details = _load_certificate_details(cert_path)
+            _cert_cache[cert_path] = (mtime, details)
+
+        domains = details['domains']
+        not_before = details['not_before']
+        not_after = details['not_after']
+        days_until_expiry = (not_after - datetime.now(not_after.tzinfo)).days
+
+        # Log certificate details
+        logger.info("=" * 70)
+        logger.info("SSL CERTIFICATE DETAILS:")
+        logger.info(f"  Issuer: {details['issuer']}")
+        logger.info(f"  Domains covered ({len(domains)}):")
+        for domain in domains:
+            logger.info(f"    • {domain}")
+        logger.info(f"  Valid from: {not_before.strftime('%Y-%m-%d %H:%M:%S UTC')}")
+        logger.info(f"  Valid until: {not_after.strftime('%Y-%m-%d %H:%M:%S UTC')}")
+        logger.info(f"  Days until expiry: {days_until_expiry}")
+        if days_until_expiry < 30:
+            logger.warning(f"  ⚠️  Certificate expires soon! ({days_until_expiry} days)")
+        logger.info("=" * 70)
+
+    except Exception as e:
+        logger.warning(f"Could not parse certificate details: {e}")
+
+
+def _list_files(directory: Path) -> Set[str]:
+    """Return the names of the files in a directory, or an empty set if it is unreadable."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    except OSError:
+        return set()
+
+
+def _pick_cert_pair(cert_files: Set[str], key_files: Set[str],
+                    cert_names: List[str], key_names: List[str]) -> Optional[Tuple[str, str]]:
+    """Pick the first known certificate and key names present in the given listings."""
+    cert_name = next((name for name in cert_names if name in cert_files), None)
+    key_name = next((name for name in key_names if name in key_files), None)
+    if cert_name and key_name:
+        return (cert_name, key_name)
+    return None
+
+
+def find_ssl_certificates() -> Tuple[str, str]:
+    """
+    Find SSL certificate and key files by checking multiple locations.
+    Returns tuple of (cert_path, key_path).
+
+    Search order:
+    1. /app/ssl/ directory (Docker volume mount)
+    2. ../ssl/ directory (BroFerence/ssl folder - relative to server directory)
+    3. /etc/letsencrypt/live/ directory (Let's Encrypt certs - checks all domains)
+    4. /etc/ssl/ directory (system-wide certs - fallback)
+    """
+    cert_names = ['fullchain.pem', 'cert.pem', 'certificate.pem']
+    key_names = ['privkey.pem', 'key.pem', 'private.pem']
+
+    # Check multiple possible ssl directories
+    ssl_dirs = [
+        Path('/app/ssl'),  # Docker volume mount
+        Path(__file__).parent.parent / 'ssl',  # Relative to script
+    ]
+
+    for ssl_dir in ssl_dirs:
+        logger.info(f"Checking for SSL certificates in: {ssl_dir.absolute()}")
+        # List the directory once instead of probing each candidate name
+        files = _list_files(ssl_dir)
+        pair = _pick_cert_pair(files, files, cert_names, key_names)
+        if pair:
+            cert_name, key_name = pair
+            cert_path = ssl_dir / cert_name
+            key_path = ssl_dir / key_name
+            logger.info(f"✓ Found SSL certificates in {ssl_dir}: {cert_name}, {key_name}")
+            return (str(cert_path.absolute()), str(key_path.absolute()))
+
+    # Location 2: Let's Encrypt directory - check all domain folders
+    letsencrypt_dir = Path('/etc/letsencrypt/live')
+    if letsencrypt_dir.exists():
+        # Find all domain directories
+        try:
+            for domain_dir in letsencrypt_dir.iterdir():
+                if domain_dir.is_dir():
+                    cert_path = domain_dir / 'fullchain.pem'
+                    key_path = domain_dir / 'privkey.pem'
+                    if cert_path.exists() and key_path.exists():
+                        logger.info(f"✓ Found Let's Encrypt certificates for domain: {domain_dir.name}")
+                        return (str(cert_path), str(key_path))
+        except PermissionError:
+            logger.warning("Permission denied accessing /etc/letsencrypt/live")
+
+    # Location 3: System SSL directory
+    pair = _pick_cert_pair(_list_files(Path('/etc/ssl/certs')), _list_files(Path('/etc/ssl/private')),
+                           cert_names, key_names)
+    if pair:
+        cert_name, key_name = pair
+        cert_path = Path(f'/etc/ssl/certs/{cert_name}')
+        key_path = Path(f'/etc/ssl/private/{key_name}')
+        logger.info(f"✓ Found SSL certificates in /etc/ssl/: {cert_name}, {key_name}")
+        return (str(cert_path), str(key_path))
+
+    # Fallback to hardcoded paths (original behavior)
+    logger.warning("No SSL certificates found in standard locations, using fallback paths")
+    return ('/etc/ssl/certs/fullchain.pem', '/etc/ssl/private/privkey.pem')
+
+
+def encode_message(message: dict) -> str:
+    """Serialize a message to compact JSON text for a websocket text frame."""
+    return orjson.dumps(message).decode('utf-8')
+
+
+def _fill_template(template: str, *values) -> str:
+    """Substitute JSON-encoded values into a pre-built message template."""
+    return template % tuple(orjson.dumps(value).decode('utf-8') for value in values)
+
+
+def encode_batch(messages: List[str]) -> str:
+    """Wrap already-serialized messages in a single batch envelope."""
+    return '{"type":"batch","msgs":[' + ','.join(messages) + ']}'
+
+
+async def _writer_loop(websocket: WebSocketServerProtocol, queue: asyncio.Queue):
+    """Drain a client's outbound queue onto its websocket, in order."""
+    try:
+        while True:
+            batch = [await queue.get()]
+            # Coalesce whatever else is already waiting into one frame
+            while batch[-1] is not None and len(batch) < MAX_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            close = batch[-1] is None
+            if close:
+                batch.pop()
+            if len(batch) == 1:
+                await websocket.send(batch[0])
+            elif batch:
+                await websocket.send(encode_batch(batch))
+
+            if close:
+                # Close only after everything queued ahead of it was sent
+                await websocket.close()
+                return
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+def queue_message(websocket: WebSocketServerProtocol, message: Optional[str]) -> bool:
+    """Queue a serialized message for delivery to a registered client.
+
+    Queueing None closes the connection once earlier messages are sent.
+    """
+    return _enqueue(clients[websocket], message)
+
+
+def _enqueue(client_info: ClientInfo, message: Optional[str]) -> bool:
+    """Queue a serialized message on a client's outbound queue."""
+    try:
+        client_info.outq.put_nowait(message)
+        return True
+    except asyncio.QueueFull:
+        # Drop lagging clients instead of buffering for them without bound
+        if not client_info.dropped:
+            client_info.dropped = True
+            logger.warning("Outbound queue full for client %s, disconnecting", client_info.id)
+            close_task = asyncio.create_task(client_info.websocket.close(code=1013, reason='Client too slow'))
+            _background_tasks.add(close_task)
+            close_task.add_done_callback(_background_tasks.discard)
+        return False
+
+
+async def register_client(websocket: WebSocketServerProtocol, client_id: str, username: str = None):
+    """Register a new client connection."""
+    if isinstance(client_id, str):
+        # Interned IDs let room and ban lookups match on identity first
+        client_id = sys.intern(client_id)
+    previous = clients.get(websocket)
+    if previous is not None:
+        # Re-registering on the same connection: keep its existing writer
+        outq = previous.outq
+        writer_task = previous.writer_task
+        # Drop the old ID from the index so it can't route to this connection
+        if id_to_ws.get(previous.id) is websocket:
+            del id_to_ws[previous.id]
+        # Leave properly so others see user-left and an emptied room is cleaned up
+        await leave_room(websocket)
+    else:
+        outq = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+        writer_task = asyncio.create_task(_writer_loop(websocket, outq))
+    clients[websocket] = ClientInfo(
+        id=client_id,
+        username=username or f"User_{client_id[:8]}",
+        websocket=websocket,
+        outq=outq,
+        writer_task=writer_task
+    )
+    id_to_ws[client_id] = websocket
+    logger.info("Client %s (%s) connected. Total clients: %d", client_id, clients[websocket].username, len(clients))
+
+
+async def unregister_client(websocket: WebSocketServerProtocol):
+    """Remove a client and clean up their room."""
+    if websocket in clients:
+        client_info = clients[websocket]
+        client_id = client_info.id
+        username = client_info.username
+        room = client_info.room
+
+        # Remove from room if in one
+        room_state = rooms.get(room) if room else None
+        if room_state is not None:
+            _remove_from_room(room, client_id, websocket)
+
+            # Clean up empty rooms before anything below can yield, so a
+            # concurrent leave never sees a half-removed room
+            room_empty = not room_state.members
+            if room_empty:
+                del rooms[room]
+                logger.info("Room %s deleted (empty)", room)
+            else:
+                # Notify others in room
+                await broadcast_to_room(room, _fill_template(_USER_LEFT_TMPL, client_id, username), exclude=websocket)
+
+            # Send IRC notification
+            if irc_bridge and room_state.irc_channel:
+                if irc_bridge.connected:
+                    irc_bridge.send_message(room, "System", f"{username} left the room")
+                # Drop the mapping even while reconnecting so it isn't rejoined
+                if room_empty:
+                    irc_bridge.leave_channel(room)
+
+        client_info.writer_task.cancel()
+        del clients[websocket]
+        # Only drop the index entry if it still points at this connection
+        if id_to_ws.get(client_id) is websocket:
+            del id_to_ws[client_id]
+        logger.info("Client %s disconnected. Total clients: %d", client_id, len(clients))
+
+
+async def create_room(room_id: str, password: Optional[str] = None, irc_channel: Optional[str] = None, moderator_id: Optional[str] = None):
+    """Create a new room."""
+    if room_id not in rooms:
+        rooms[room_id] = Room(
+            password=stored_password(password) if password else None,
+            irc_channel=irc_channel,
+            moderator=moderator_id  # First user to create the room becomes moderator
+        )
+        room = rooms[room_id]
+        room.joined_prefix = _fill_template(
+            _ROOM_JOINED_PREFIX_TMPL, room_id, room.password is not None, room.irc_channel, room.moderator
+        )
+
+        # Initialize IRC bridge if channel specified and not already connected
+        if irc_channel and config.enable_irc:
+            if not irc_bridge_available():
+                logger.info("IRC channel specified (%s), initializing IRC bridge...", irc_channel)
+                success = await init_irc_bridge()
+                if not success:
+                    logger.error("Failed to connect IRC bridge for room %s", room_id)
+
+        # Join IRC channel if specified and bridge is available; a reconnecting
+        # bridge joins it once it is back
+        if irc_channel and irc_bridge_available():
+            irc_bridge.join_channel(irc_channel, room_id)
+
+            # Register callback for IRC messages
+            async def irc_message_callback(nick: str, message: str):
+                await broadcast_to_room(room_id, _fill_template(
+                    _CHAT_TMPL, f"{nick} (IRC)", message, time.monotonic()
+                ))
+
+            irc_bridge.register_message_callback(room_id, irc_message_callback)
+            logger.info("✓ IRC bridge joined channel %s for room %s", irc_channel, room_id)
+
+        logger.info("Room %s created", room_id)
+
+
+async def join_room(websocket: WebSocketServerProtocol, room_id: str, password: Optional[str] = None):
+    """Add client to a room."""
+    client_info = clients[websocket]
+    client_id = client_info.id
+    username = client_info.username
+
+    # Check if room exists
+    room_state = rooms.get(room_id)
+    if room_state is None:
+        queue_message(websocket, encode_message({
+            'type': 'error',
+            'message': 'Room does not exist'
+        }))
+        return False
+
+    # Check if user is banned
+    if client_id in room_state.banned:
+        queue_message(websocket, encode_message({
+            'type': 'error',
+            'message': 'You have been banned from this room'
+        }))
+        return False
+
+    # Check password if required
+    if room_state.password:
+        if not password:
+            queue_message(websocket, encode_message({
+                'type': 'password-required',
+                'roomId': room_id
+            }))
+            return False
+
+        if not hmac.compare_digest(stored_password(password).encode(), room_state.password.encode()):
+            queue_message(websocket, encode_message({
+                'type': 'error',
+                'message': 'Incorrect password'
+            }))
+            return False
+
+    # Leave current room if in one
+    if client_info.room:
+        await leave_room(websocket)
+
+        # Leaving can yield; the target room may have emptied meanwhile
+        if room_id not in rooms:
+            queue_message(websocket, encode_message({
+                'type': 'error',
+                'message': 'Room does not exist'
+            }))
+            return False
+
+    # Join new room first so user can receive messages. Hold on to the
+    # room itself: broadcasts below can yield while others come and go
+    room = rooms[room_id]
+    room.members[client_id] = client_info
+    client_info.room = room_id
+
+    # Initialize IRC bridge if room has IRC channel and bridge is not connected
+    irc_channel = room.irc_channel
+    irc_status_msg = None
+
+    if irc_channel and config.enable_irc:
+        if not irc_bridge_available():
+            logger.info("Room has IRC channel (%s), ensuring IRC bridge is connected...", irc_channel)
+            # Send connecting message
+            await broadcast_to_room(room_id, _fill_template(
+                _CHAT_TMPL, 'System', f'🔌 Connecting to IRC ({irc_channel})...', time.monotonic()
+            ))
+
+            success = await init_irc_bridge()
+            if not success:
+                irc_status_msg = f'❌ Failed to connect to IRC bridge'
+            else:
+                irc_status_msg = f'✓ Connected to IRC bridge'
+
+        # Join IRC channel if bridge is available and we're not already in it
+        if irc_bridge_available() and room_id not in irc_bridge.room_channels:
+            irc_bridge.join_channel(irc_channel, room_id)
+
+            # Register callback for IRC messages
+            async def irc_message_callback(nick: str, message: str):
+                await broadcast_to_room(room_id, _fill_template(
+                    _CHAT_TMPL, f"{nick} (IRC)", message, time.monotonic()
+                ))
+
+            irc_bridge.register_message_callback(room_id, irc_message_callback)
+            logger.info("✓ IRC bridge joined channel %s for room %s", irc_channel, room_id)
+            if irc_bridge.connected:
+                irc_status_msg = f'✓ IRC bridge active on {irc_channel}'
+            else:
+                irc_status_msg = f'🔄 IRC bridge reconnecting, will rejoin {irc_channel}'
+        elif irc_bridge and irc_bridge.connected:
+            # Already in channel
+            irc_status_msg = f'✓ IRC bridge already connected to {irc_channel}'
+        elif irc_bridge_reconnecting():
+            irc_status_msg = f'🔄 IRC bridge reconnecting, will rejoin {irc_channel}'
+        elif not irc_bridge or not irc_bridge.connected:
+            if not irc_status_msg:  # Only if we didn't already set error message
+                irc_status_msg = f'❌ IRC bridge not connected'
+
+    # Send IRC status message if we have one
+    if irc_status_msg:
+        await broadcast_to_room(room_id, _fill_template(_CHAT_TMPL, 'System', irc_status_msg, time.monotonic()))
+
+    # Get list of other users in room
+    other_users = [
+        {
+            'id': member.id,
+            'username': member.username
+        }
+        for member in room.members.values()
+        if member.websocket is not websocket
+    ]
+
+    logger.info("Client %s (%s) joined room %s. Room size: %d", client_id, username, room_id, len(room.members))
+
+    # Check if user is moderator
+    is_moderator = (room.moderator == client_id)
+
+    # Send room info to joining client; only the users list and
+    # moderator flag vary per join
+    queue_message(websocket, '%s"users":%s,"isModerator":%s}' % (
+        room.joined_prefix, orjson.dumps(other_users).decode('utf-8'), 'true' if is_moderator else 'false'
+    ))
+
+    # Notify others in room
+    await broadcast_to_room(room_id, _fill_template(_USER_JOINED_TMPL, client_id, username), exclude=websocket)
+
+    # Send IRC notification
+    if irc_bridge and irc_bridge.connected and room.irc_channel:
+        irc_bridge.send_message(room_id, "System", f"{username} joined the room")
+
+    return True
+
+
+async def leave_room(websocket: WebSocketServerProtocol):
+    """Remove client from their current room."""
+    client_info = clients[websocket]
+    room = client_info.room
+
+    room_state = rooms.get(room) if room else None
+    if room_state is not None:
+        _remove_from_room(room, client_info.id, websocket)
+        client_info.room = None
+
+        # Clean up empty rooms before anything below can yield
+        if not room_state.members:
+            del rooms[room]
+            if irc_bridge and room_state.irc_channel:
+                irc_bridge.leave_channel(room)
+            return
+
+        # Notify others
+        await broadcast_to_room(room, _fill_template(_USER_LEFT_TMPL, client_info.id, client_info.username),
+                                exclude=websocket)
+
+
+def _remove_from_room(room_id: str, client_id: str, websocket: WebSocketServerProtocol):
+    """Drop a client's room entry, unless its ID now belongs to another connection."""
+    members = rooms[room_id].members
+    member = members.get(client_id)
+    if member is not None and member.websocket is websocket:
+        del members[client_id]
+
+
+def ban_from_room(room: Room, client_id: str):
+    """Add a client ID to a room's ban list, evicting the oldest ban when full."""
+    banned = room.banned
+    banned[client_id] = None
+    banned.move_to_end(client_id)
+    if len(banned) > MAX_BANNED_PER_ROOM:
+        banned.popitem(last=False)
+
+
+async def broadcast_to_room(room_id: str, message: Union[dict, str], exclude: WebSocketServerProtocol = None):
+    """Send a message (a dict, or already-serialized JSON) to all clients in a room except the excluded one."""
+    room = rooms.get(room_id)
+    if room is None:
+        return
+
+    # Skip serialization entirely when nobody but the sender is in the room
+    members = room.members
+    if len(members) <= 1 and all(member.websocket is exclude for member in members.values()):
+        return
+
+    # Serialize once and hand the same text to each recipient's writer.
+    # This is websockets.broadcast()'s fan-out without its bypass: writing
+    # straight to the transports would overtake messages already queued
+    # for a client and skip batching. Room members are always registered:
+    # clients leave their room before they are removed from clients, so
+    # no membership check is needed here
+    message_json = message if isinstance(message, str) else encode_message(message)
+    if len(members) <= BROADCAST_BATCH_SIZE:
+        for member in members.values():
+            if member.websocket is not exclude:
+                _enqueue(member, message_json)
+        return
+
+    # Large rooms: yield to the event loop between slices so one broadcast
+    # can't hold up signaling for every other room. Work from a snapshot,
+    # since members may join or leave while we're yielded
+    recipients = [member for member in members.values() if member.websocket is not exclude]
+    for start in range(0, len(recipients), BROADCAST_BATCH_SIZE):
+        if start:
+            await asyncio.sleep(0)
+        for member in recipients[start:start + BROADCAST_BATCH_SIZE]:
+            _enqueue(member, message_json)
+
+
+def find_room_member(room_id: str, client_id: str) -> Optional[WebSocketServerProtocol]:
+    """Look up a connected client by ID, provided they are in the given room."""
+    room = rooms.get(room_id)
+    member = room.members.get(client_id) if room else None
+    return member.websocket if member else None
+
+
+async def relay_to_peer(target_id: str, message: Union[dict, str]):
+    """Send a message (a dict, or already-serialized JSON) to a specific peer by their client ID."""
+    websocket = id_to_ws.get(target_id)
+    if websocket is None:
+        return False
+    message_json = message if isinstance(message, str) else encode_message(message)
+    return queue_message(websocket, message_json)
+
+
+async def _handle_register(websocket: WebSocketServerProtocol, data: dict):
+    """Client registering with ID."""
+    client_id = data.get('clientId')
+    username = data.get('username')
+    await register_client(websocket, client_id, username)
+    queue_message(websocket, encode_message({
+        'type': 'registered',
+        'clientId': client_id,
+        'username': username
+    }))
+
+
+async def _handle_create_room(websocket: WebSocketServerProtocol, data: dict):
+    """Create a new room."""
+    room_id = data.get('roomId')
+    password = data.get('password')
+    irc_channel = data.get('ircChannel')
+    # The creator moderates the room when moderation is enabled
+    moderator_id = clients[websocket].id if config.moderation else None
+    await create_room(room_id, password, irc_channel, moderator_id)
+    await join_room(websocket, room_id, password)
+
+
+async def _handle_join_room(websocket: WebSocketServerProtocol, data: dict):
+    """Client wants to join a room."""
+    room_id = data.get('roomId')
+    password = data.get('password')
+
+    # Create room if it doesn't exist
+    if room_id not in rooms:
+        await create_room(room_id)
+
+    await join_room(websocket, room_id, password)
+
+
+async def _handle_leave_room(websocket: WebSocketServerProtocol, data: dict):
+    """Client leaving room."""
+    await leave_room(websocket)
+
+
+async def _handle_chat_message(websocket: WebSocketServerProtocol, data: dict):
+    """Chat message in room."""
+    client_info = clients[websocket]
+    room = client_info.room
+    username = client_info.username
+    msg_content = data.get('message')
+
+    if room:
+        irc_channel = rooms[room].irc_channel
+
+        # Broadcast to WebRTC users
+        await broadcast_to_room(room, _fill_template(
+            _CHAT_TMPL, username, msg_content, time.monotonic()
+        ))
+
+        # Send to IRC if bridged
+        if irc_bridge and irc_bridge.connected and irc_channel:
+            irc_bridge.send_message(room, username, msg_content)
+
+
+async def _handle_watch_video(websocket: WebSocketServerProtocol, data: dict):
+    """Share video URL with room - opens in everyone's browser."""
+    client_info = clients[websocket]
+    room = client_info.room
+    username = client_info.username
+
+    if room:
+        await broadcast_to_room(room, {
+            'type': 'watch-video',
+            'url': data.get('url'),
+            'username': username
+        }, exclude=websocket)
+
+
+async def _handle_video_state(websocket: WebSocketServerProtocol, data: dict):
+    """User toggled their video - broadcast to room."""
+    client_info = clients[websocket]
+    room = client_info.room
+    client_id = client_info.id
+    video_enabled = data.get('videoEnabled', True)
+
+    if room:
+        await broadcast_to_room(room, {
+            'type': 'video-state',
+            'clientId': client_id,
+            'videoEnabled': video_enabled
+        }, exclude=websocket)
+
+
+async def _handle_audio_state(websocket: WebSocketServerProtocol, data: dict):
+    """User toggled their audio - broadcast to room."""
+    client_info = clients[websocket]
+    room = client_info.room
+    client_id = client_info.id
+    audio_enabled = data.get('audioEnabled', True)
+
+    if room:
+        await broadcast_to_room(room, {
+            'type': 'audio-state',
+            'clientId': client_id,
+            'audioEnabled': audio_enabled
+        }, exclude=websocket)
+
+
+async def _handle_relay(websocket: WebSocketServerProtocol, data: dict):
+    """WebRTC signaling messages - relay to target peer."""
+    # Pull every field this handler needs out of the message up front
+    msg_type = data['type']
+    target_id = data.get('targetId')
+    payload = data.get('data')
+    sender_id = clients[websocket].id
+
+    # Only the sender ID and payload vary; splice them into the envelope
+    relay_message = _fill_template(_RELAY_TMPLS[msg_type], sender_id, payload)
+
+    success = await relay_to_peer(target_id, relay_message)
+    if not success:
+        logger.debug("Could not relay %s to %s", msg_type, target_id)
+
+
+async def _handle_kick_user(websocket: WebSocketServerProtocol, data: dict):
+    """Moderator kicking a user."""
+    client_info = clients[websocket]
+    room = client_info.room
+    room_state = rooms[room] if room else None
+
+    if room_state and room_state.moderator == client_info.id:
+        target_id = data.get('targetId')
+
+        # Find and disconnect the target user once the notice is sent
+        ws = find_room_member(room, target_id)
+        if ws:
+            queue_message(ws, encode_message({
+                'type': 'kicked',
+                'message': 'You have been kicked from the room'
+            }))
+            queue_message(ws, None)
+    else:
+        queue_message(websocket, encode_message({
+            'type': 'error',
+            'message': 'Only moderator can kick users'
+        }))
+
+
+async def _handle_ban_user(websocket: WebSocketServerProtocol, data: dict):
+    """Moderator banning a user."""
+    client_info = clients[websocket]
+    room = client_info.room
+    room_state = rooms[room] if room else None
+
+    if room_state and room_state.moderator == client_info.id:
+        target_id = data.get('targetId')
+
+        # Add to banned list
+        ban_from_room(room_state, target_id)
+
+        # Find and disconnect the target user once the notice is sent
+        ws = find_room_member(room, target_id)
+        if ws:
+            queue_message(ws, encode_message({
+                'type': 'banned',
+                'message': 'You have been banned from this room'
+            }))
+            queue_message(ws, None)
+
+        logger.info("User %s banned from room %s", target_id, room)
+    else:
+        queue_message(websocket, encode_message({
+            'type': 'error',
+            'message': 'Only moderator can ban users'
+        }))
+
+
+async def _handle_change_name(websocket: WebSocketServerProtocol, data: dict):
+    """User changing their name."""
+    client_info = clients[websocket]
+    room = client_info.room
+    old_username = client_info.username
+    new_username = data.get('newUsername', '').strip()
+
+    if new_username and room:
+        # Update username
+        client_info.username = new_username
+        irc_channel = rooms[room].irc_channel
+
+        # Broadcast name change to room
+        await broadcast_to_room(room, {
+            'type': 'name-changed',
+            'clientId': client_info.id,
+            'oldUsername': old_username,
+            'newUsername': new_username
+        }, exclude=websocket)
+
+        # Send IRC notification if bridged
+        if irc_bridge and irc_bridge.connected and irc_channel:
+            irc_bridge.send_message(room, "System", f"{old_username} changed their name to {new_username}")
+
+        logger.info("User %s changed name to %s in room %s", old_username, new_username, room)
+
+
+async def _handle_promote_moderator(websocket: WebSocketServerProtocol, data: dict):
+    """Moderator promoting another user to moderator."""
+    client_info = clients[websocket]
+    room = client_info.room
+    room_state = rooms[room] if room else None
+
+    if room_state and room_state.moderator == client_info.id:
+        target_id = data.get('targetId')
+
+        # Find target user
+        ws = find_room_member(room, target_id)
+        if ws:
+            info = clients[ws]
+
+            # Notify the target user
+            queue_message(ws, encode_message({
+                'type': 'you-are-moderator'
+            }))
+
+            # Broadcast to room
+            await broadcast_to_room(room, {
+                'type': 'moderator-promoted',
+                'moderatorId': target_id,
+                'username': info.username
+            })
+
+            # Send IRC notification if bridged
+            if irc_bridge and irc_bridge.connected and room_state.irc_channel:
+                irc_bridge.send_message(room, "System", f"{info.username} is now a moderator")
+
+            logger.info("User %s promoted to moderator in room %s", target_id, room)
+    else:
+        queue_message(websocket, encode_message({
+            'type': 'error',
+            'message': 'Only moderator can promote users'
+        }))
+
+
+async def _handle_moderator_change_name(websocket: WebSocketServerProtocol, data: dict):
+    """Moderator changing another user's name."""
+    client_info = clients[websocket]
+    room = client_info.room
+    room_state = rooms[room] if room else None
+
+    if room_state and room_state.moderator == client_info.id:
+        target_id = data.get('targetId')
+        new_username = data.get('newUsername', '').strip()
+
+        # Find target user and update their name
+        ws = find_room_member(room, target_id) if new_username else None
+        if ws:
+            info = clients[ws]
+            old_username = info.username
+            info.username = new_username
+
+            # Notify the target user
+            queue_message(ws, encode_message({
+                'type': 'name-changed-by-moderator',
+                'newUsername': new_username
+            }))
+
+            # Broadcast to room
+            await broadcast_to_room(room, {
+                'type': 'name-changed',
+                'clientId': target_id,
+                'oldUsername': old_username,
+                'newUsername': new_username
+            })
+
+            # Send IRC notification if bridged
+            if irc_bridge and irc_bridge.connected and room_state.irc_channel:
+                irc_bridge.send_message(room, "System", f"Moderator changed {old_username}'s name to {new_username}")
+
+            logger.info("Moderator changed %s to %s in room %s", old_username, new_username, room)
+    else:
+        queue_message(websocket, encode_message({
+            'type': 'error',
+            'message': 'Only moderator can change user names'
+        }))
+
+
+# Message handlers keyed by message type (relays are dispatched separately)
+_HANDLERS: Dict[str, Callable[[WebSocketServerProtocol, dict], Awaitable[None]]] = {
+    'register': _handle_register,
+    'create-room': _handle_create_room,
+    'join-room': _handle_join_room,
+    'leave-room': _handle_leave_room,
+    'chat-message': _handle_chat_message,
+    'watch-video': _handle_watch_video,
+    'video-state': _handle_video_state,
+    'audio-state': _handle_audio_state,
+    'kick-user': _handle_kick_user,
+    'ban-user': _handle_ban_user,
+    'change-name': _handle_change_name,
+    'promote-moderator': _handle_promote_moderator,
+    'moderator-change-name': _handle_moderator_change_name,
+}
+
+
+def _parse(message: str) -> Optional[dict]:
+    """Decode an incoming JSON message, logging and returning None if it is malformed."""
+    try:
+        data = orjson.loads(message)
+    except orjson.JSONDecodeError:
+        logger.error("Invalid JSON received: %s", message)
+        return None
+    if not isinstance(data, dict):
+        logger.error("Message is not a JSON object: %s", message)
+        return None
+    return data
+
+
+async def _dispatch(websocket: WebSocketServerProtocol, data: dict):
+    """Route a decoded message to the handler for its type."""
+    msg_type = data.get('type')
+    # Relays make up most traffic in an active call; skip the table for them
+    if msg_type in _RELAY_TYPES:
+        await _handle_relay(websocket, data)
+        return
+
+    message_handler = _HANDLERS.get(msg_type)
+    if message_handler is None:
+        logger.warning("Unknown message type: %s", msg_type)
+        return
+    await message_handler(websocket, data)
+
+
+async def handler(websocket: WebSocketServerProtocol):
+    """Main WebSocket connection handler."""
+    # Signaling frames are small and latency-sensitive: don't let Nagle's
+    # algorithm hold them back waiting for delayed ACKs
+    sock = websocket.transport.get_extra_info('socket')
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if hasattr(socket, 'TCP_QUICKACK'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+    try:
+        async for message in websocket:
+            data = _parse(message)
+            if data is None:
+                continue
+            try:
+                await _dispatch(websocket, data)
+            except websockets.exceptions.ConnectionClosed:
+                raise
+            except Exception as e:
+                # A failing handler shouldn't take the connection down with it
+                logger.error("Error handling message: %s", e, exc_info=True)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        await unregister_client(websocket)
+
+
+async def serve_signaling(server_config: Config):
+    """Start the WebSocket server with the given configuration and run forever."""
+    global config
+    config = server_config
+    host = config.host
+    port = config.port
+
+    ssl_context = None
+    if config.use_ssl:
+        # Find SSL certificates
+        cert_path, key_path = find_ssl_certificates()
+
+        # SSL context for WSS
+        try:
+            ssl_context = server_ssl_context(cert_path, key_path)
+            logger.info(f"Loaded SSL certificates: {cert_path}, {key_path}")
+        except Exception as e:
+            logger.error(f"Failed to load SSL certificates: {e}")
+            raise
+
+        logger.info(f"Starting enhanced WebRTC signaling server on wss://{host}:{port}")
+    else:
+        logger.info(f"Starting LOCAL DEV WebRTC signaling server on ws://{host}:{port}")
+        logger.info("NOTE: This is for LOCAL DEVELOPMENT ONLY - No SSL/encryption!")
+
+    features = ["Multi-participant"]
+    if config.enable_irc:
+        features.append("IRC bridge (on-demand)")
+    features.append("Password protection")
+    if config.moderation:
+        features.append("Moderation")
+    logger.info(f"Features: {', '.join(features)}")
+
+    # Signaling frames are small JSON documents; per-message deflate costs
+    # more CPU than it saves on payloads this size
+    async with websockets.serve(handler, host, port, ssl=ssl_context, compression=None):
+        if ssl_context is not None:
+            # Parse the certificate for the log once the socket is already
+            # accepting connections, on a thread so the loop keeps serving
+            await asyncio.to_thread(log_certificate_info, cert_path)
+        await asyncio.Future()  # Run forever
+
+
+def run(server_config: Config):
+    """Run the signaling server until interrupted."""
+    # Prefer uvloop's libuv-based event loop when it is installed
+    try:
+        import uvloop
+        run_loop = uvloop.run
+    except ImportError:
+        run_loop = asyncio.run
+    run_loop(serve_signaling(server_config))
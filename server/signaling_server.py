@@ -5,316 +5,333 @@ Handles signaling between peers for WebRTC connections
 """
 
 import asyncio
-import json
 import logging
-import ssl
-from typing import Dict, Set, Tuple
+import socket
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Set, Union
+import orjson
 import websockets
 from websockets.server import WebSocketServerProtocol
-from pathlib import Path
-from datetime import datetime
-from cryptography import x509
-from cryptography.hazmat.backends import default_backend
+from signaling_core import find_ssl_certificates, log_certificate_info, server_ssl_context
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Store connected clients: {websocket: {'id': str, 'room': str}}
-clients: Dict[WebSocketServerProtocol, dict] = {}
-# Store rooms: {room_id: Set[websocket]}
-rooms: Dict[str, Set[WebSocketServerProtocol]] = {}
+
+@dataclass(slots=True)
+class ClientInfo:
+    """State kept for each registered connection."""
+    id: str
+    outq: asyncio.Queue
+    writer_task: asyncio.Task
+    room: Optional[str] = None
+    dropped: bool = False
+
+
+# Store connected clients: {websocket: ClientInfo}
+clients: Dict[WebSocketServerProtocol, ClientInfo] = {}
+# Store rooms: {room_id: {client_id: websocket}}
+rooms: Dict[str, Dict[str, WebSocketServerProtocol]] = {}
+# Index of connected clients by ID: {client_id: websocket}
+clients_by_id: Dict[str, WebSocketServerProtocol] = {}
+
+# Fire-and-forget tasks, kept referenced until they finish so they aren't
+# garbage-collected mid-flight
+_background_tasks: Set[asyncio.Task] = set()
+
+# Pre-built JSON for fixed-shape notifications; only the client ID varies
+_REGISTERED_TMPL = '{"type":"registered","clientId":%s}'
+_USER_JOINED_TMPL = '{"type":"user-joined","clientId":%s}'
+_USER_LEFT_TMPL = '{"type":"user-left","clientId":%s}'
+
+# Pre-built envelopes for relayed WebRTC signaling messages
+_RELAY_TMPLS = {
+    msg_type: '{"type":"%s","senderId":%%s,"data":%%s}' % msg_type
+    for msg_type in ('offer', 'answer', 'ice-candidate')
+}
+_RELAY_TYPES = frozenset(_RELAY_TMPLS)
+
+# Largest inbound frame accepted; full SDP offers with several media
+# sections can exceed 8 KiB, so leave headroom above that
+MAX_MESSAGE_SIZE = 64 * 1024
+
+# Maximum number of messages buffered for a single client before it is
+# considered a slow consumer and disconnected
+OUTBOUND_QUEUE_SIZE = 128
+
+
+def encode_message(message: dict) -> str:
+    """Serialize a message to compact JSON text for a websocket text frame."""
+    return orjson.dumps(message).decode('utf-8')
+
+
+def _fill_template(template: str, *values) -> str:
+    """Substitute JSON-encoded values into a pre-built message template."""
+    return template % tuple(orjson.dumps(value).decode('utf-8') for value in values)
+
+
+async def _writer_loop(websocket: WebSocketServerProtocol, queue: asyncio.Queue):
+    """Drain a client's outbound queue onto its websocket, in order."""
+    try:
+        while True:
+            message = await queue.get()
+            await websocket.send(message)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+def queue_message(websocket: WebSocketServerProtocol, message: str) -> bool:
+    """Queue a serialized message for delivery to a registered client."""
+    client_info = clients[websocket]
+    try:
+        client_info.outq.put_nowait(message)
+        return True
+    except asyncio.QueueFull:
+        # Drop lagging clients instead of buffering for them without bound
+        if not client_info.dropped:
+            client_info.dropped = True
+            logger.warning("Outbound queue full for client %s, disconnecting", client_info.id)
+            close_task = asyncio.create_task(websocket.close(code=1013, reason='Client too slow'))
+            _background_tasks.add(close_task)
+            close_task.add_done_callback(_background_tasks.discard)
+        return False
 
 
 async def register_client(websocket: WebSocketServerProtocol, client_id: str):
     """Register a new client connection."""
-    clients[websocket] = {'id': client_id, 'room': None}
-    logger.info(f"Client {client_id} connected. Total clients: {len(clients)}")
+    if websocket in clients:
+        # Re-registering on the same connection: keep its existing writer
+        client_info = clients[websocket]
+        if clients_by_id.get(client_info.id) is websocket:
+            del clients_by_id[client_info.id]
+        # Leave properly so peers see user-left instead of a dangling old ID
+        await leave_room(websocket)
+        client_info.room = None
+        client_info.id = client_id
+    else:
+        outq = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+        clients[websocket] = ClientInfo(
+            id=client_id,
+            outq=outq,
+            writer_task=asyncio.create_task(_writer_loop(websocket, outq))
+        )
+    clients_by_id[client_id] = websocket
+    logger.info("Client %s connected. Total clients: %d", client_id, len(clients))
 
 
 async def unregister_client(websocket: WebSocketServerProtocol):
     """Remove a client and clean up their room."""
     if websocket in clients:
         client_info = clients[websocket]
-        client_id = client_info['id']
-        room = client_info['room']
+        client_id = client_info.id
+        room = client_info.room
 
         # Remove from room if in one
         if room and room in rooms:
-            rooms[room].discard(websocket)
-            # Notify others in room
-            await broadcast_to_room(room, {
-                'type': 'user-left',
-                'clientId': client_id
-            }, exclude=websocket)
-
-            # Clean up empty rooms
-            if not rooms[room]:
+            _remove_from_room(room, client_id, websocket)
+            if rooms[room]:
+                # Notify others in room
+                await broadcast_to_room(room, _fill_template(_USER_LEFT_TMPL, client_id), exclude=websocket)
+            else:
+                # Clean up empty rooms
                 del rooms[room]
-                logger.info(f"Room {room} deleted (empty)")
+                logger.info("Room %s deleted (empty)", room)
 
+        client_info.writer_task.cancel()
         del clients[websocket]
-        logger.info(f"Client {client_id} disconnected. Total clients: {len(clients)}")
+        # Only drop the index entry if it still points at this connection
+        if clients_by_id.get(client_id) is websocket:
+            del clients_by_id[client_id]
+        logger.info("Client %s disconnected. Total clients: %d", client_id, len(clients))
 
 
 async def join_room(websocket: WebSocketServerProtocol, room_id: str):
     """Add client to a room."""
     client_info = clients[websocket]
-    client_id = client_info['id']
+    client_id = client_info.id
 
     # Leave current room if in one
-    if client_info['room']:
+    if client_info.room:
         await leave_room(websocket)
 
     # Join new room
     if room_id not in rooms:
-        rooms[room_id] = set()
+        rooms[room_id] = {}
 
-    rooms[room_id].add(websocket)
-    client_info['room'] = room_id
+    rooms[room_id][client_id] = websocket
+    client_info.room = room_id
 
     # Get list of other users in room
-    other_users = [
-        clients[ws]['id']
-        for ws in rooms[room_id]
-        if ws != websocket
-    ]
+    other_users = [cid for cid in rooms[room_id] if cid != client_id]
 
-    logger.info(f"Client {client_id} joined room {room_id}. Room size: {len(rooms[room_id])}")
+    logger.info("Client %s joined room %s. Room size: %d", client_id, room_id, len(rooms[room_id]))
 
     # Send room info to joining client
-    await websocket.send(json.dumps({
+    queue_message(websocket, encode_message({
         'type': 'room-joined',
         'roomId': room_id,
         'users': other_users
     }))
 
     # Notify others in room
-    await broadcast_to_room(room_id, {
-        'type': 'user-joined',
-        'clientId': client_id
-    }, exclude=websocket)
+    if other_users:
+        await broadcast_to_room(room_id, _fill_template(_USER_JOINED_TMPL, client_id), exclude=websocket)
+
+
+def _remove_from_room(room_id: str, client_id: str, websocket: WebSocketServerProtocol):
+    """Remove a client's entry from a room if it still belongs to this connection."""
+    if rooms[room_id].get(client_id) is websocket:
+        del rooms[room_id][client_id]
 
 
 async def leave_room(websocket: WebSocketServerProtocol):
     """Remove client from their current room."""
     client_info = clients[websocket]
-    room = client_info['room']
+    room = client_info.room
 
     if room and room in rooms:
-        rooms[room].discard(websocket)
-        client_info['room'] = None
+        _remove_from_room(room, client_info.id, websocket)
+        client_info.room = None
 
-        # Notify others
-        await broadcast_to_room(room, {
-            'type': 'user-left',
-            'clientId': client_info['id']
-        }, exclude=websocket)
-
-        # Clean up empty rooms
-        if not rooms[room]:
+        if rooms[room]:
+            # Notify others
+            await broadcast_to_room(room, _fill_template(_USER_LEFT_TMPL, client_info.id), exclude=websocket)
+        else:
+            # Clean up empty rooms
             del rooms[room]
 
 
-async def broadcast_to_room(room_id: str, message: dict, exclude: WebSocketServerProtocol = None):
-    """Send a message to all clients in a room except the excluded one."""
+async def broadcast_to_room(room_id: str, message: Union[dict, str], exclude: WebSocketServerProtocol = None):
+    """Send a message (a dict, or already-serialized JSON) to all clients in a room except the excluded one."""
     if room_id not in rooms:
         return
 
-    message_json = json.dumps(message)
-    tasks = []
+    # Skip serialization entirely when nobody but the sender is in the room
+    targets = [websocket for websocket in rooms[room_id].values() if websocket is not exclude]
+    if not targets:
+        return
 
-    for websocket in rooms[room_id]:
-        if websocket != exclude and websocket in clients:
-            tasks.append(websocket.send(message_json))
+    # Serialize once and hand the same payload to every recipient's queue;
+    # each client's writer task delivers it without a task per message.
+    # websockets.broadcast() isn't used because it would write around the
+    # queues and overtake messages already waiting for a client
+    message_json = message if isinstance(message, str) else encode_message(message)
 
-    if tasks:
-        await asyncio.gather(*tasks, return_exceptions=True)
+    for websocket in targets:
+        queue_message(websocket, message_json)
 
 
-async def relay_to_peer(target_id: str, message: dict):
-    """Send a message to a specific peer by their client ID."""
-    for websocket, info in clients.items():
-        if info['id'] == target_id:
-            await websocket.send(json.dumps(message))
-            return True
-    return False
+async def relay_to_peer(target_id: str, message: Union[dict, str]):
+    """Send a message (a dict, or already-serialized JSON) to a specific peer by their client ID."""
+    websocket = clients_by_id.get(target_id)
+    if websocket is None:
+        return False
+    message_json = message if isinstance(message, str) else encode_message(message)
+    return queue_message(websocket, message_json)
 
 
-async def handle_message(websocket: WebSocketServerProtocol, message: str):
-    """Handle incoming WebSocket messages."""
-    try:
-        data = json.loads(message)
-        msg_type = data.get('type')
-
-        if msg_type == 'register':
-            # Client registering with ID
-            client_id = data.get('clientId')
-            await register_client(websocket, client_id)
-            await websocket.send(json.dumps({
-                'type': 'registered',
-                'clientId': client_id
-            }))
-
-        elif msg_type == 'join-room':
-            # Client wants to join a room
-            room_id = data.get('roomId')
-            await join_room(websocket, room_id)
-
-        elif msg_type == 'leave-room':
-            # Client leaving room
-            await leave_room(websocket)
-
-        elif msg_type in ['offer', 'answer', 'ice-candidate']:
-            # WebRTC signaling messages - relay to target peer
-            target_id = data.get('targetId')
-            sender_id = clients[websocket]['id']
-
-            relay_message = {
-                'type': msg_type,
-                'senderId': sender_id,
-                'data': data.get('data')
-            }
-
-            success = await relay_to_peer(target_id, relay_message)
-            if not success:
-                logger.warning(f"Could not relay {msg_type} to {target_id}")
+async def _handle_register(websocket: WebSocketServerProtocol, data: dict):
+    """Client registering with ID."""
+    client_id = data.get('clientId')
+    await register_client(websocket, client_id)
+    queue_message(websocket, _fill_template(_REGISTERED_TMPL, client_id))
 
-        else:
-            logger.warning(f"Unknown message type: {msg_type}")
 
-    except json.JSONDecodeError:
-        logger.error(f"Invalid JSON received: {message}")
-    except Exception as e:
-        logger.error(f"Error handling message: {e}")
+async def _handle_join_room(websocket: WebSocketServerProtocol, data: dict):
+    """Client wants to join a room."""
+    room_id = data.get('roomId')
+    await join_room(websocket, room_id)
+
+
+async def _handle_leave_room(websocket: WebSocketServerProtocol, data: dict):
+    """Client leaving room."""
+    await leave_room(websocket)
+
+
+async def _handle_relay(websocket: WebSocketServerProtocol, data: dict):
+    """WebRTC signaling messages - relay to target peer."""
+    # Pull every field this handler needs out of the message up front
+    msg_type = data['type']
+    target_id = data.get('targetId')
+    payload = data.get('data')
+    sender_id = clients[websocket].id
+
+    # Only the sender ID and payload vary; splice them into the envelope
+    relay_message = _fill_template(_RELAY_TMPLS[msg_type], sender_id, payload)
+
+    success = await relay_to_peer(target_id, relay_message)
+    if not success:
+        logger.debug("Could not relay %s to %s", msg_type, target_id)
+
+
+# Message handlers keyed by message type (relays are dispatched separately)
+_HANDLERS: Dict[str, Callable[[WebSocketServerProtocol, dict], Awaitable[None]]] = {
+    'register': _handle_register,
+    'join-room': _handle_join_room,
+    'leave-room': _handle_leave_room,
+}
+
+
+def _parse(message: str) -> Optional[dict]:
+    """Decode an incoming JSON message, logging and returning None if it is malformed."""
+    try:
+        data = orjson.loads(message)
+    except orjson.JSONDecodeError:
+        logger.error("Invalid JSON received: %s", message)
+        return None
+    if not isinstance(data, dict):
+        logger.error("Message is not a JSON object: %s", message)
+        return None
+    return data
+
+
+async def _dispatch(websocket: WebSocketServerProtocol, data: dict):
+    """Route a decoded message to the handler for its type."""
+    msg_type = data.get('type')
+    # Relays make up most traffic in an active call; skip the table for them
+    if msg_type in _RELAY_TYPES:
+        await _handle_relay(websocket, data)
+        return
+
+    message_handler = _HANDLERS.get(msg_type)
+    if message_handler is None:
+        logger.warning("Unknown message type: %s", msg_type)
+        return
+    await message_handler(websocket, data)
 
 
 async def handler(websocket: WebSocketServerProtocol):
     """Main WebSocket connection handler."""
+    # Without a userspace write buffer, drain() only returns once the kernel
+    # has accepted the data, so per-connection memory stays bounded
+    websocket.transport.set_write_buffer_limits(0)
+
+    # Signaling frames are small and latency-sensitive: don't let Nagle's
+    # algorithm hold them back waiting for delayed ACKs
+    sock = websocket.transport.get_extra_info('socket')
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if hasattr(socket, 'TCP_QUICKACK'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
     try:
         async for message in websocket:
-            await handle_message(websocket, message)
+            data = _parse(message)
+            if data is None:
+                continue
+            try:
+                await _dispatch(websocket, data)
+            except websockets.exceptions.ConnectionClosed:
+                raise
+            except Exception as e:
+                # A failing handler shouldn't take the connection down with it
+                logger.error("Error handling message: %s", e)
     except websockets.exceptions.ConnectionClosed:
         pass
     finally:
         await unregister_client(websocket)
 
 
-def log_certificate_info(cert_path: str):
-    """Log detailed information about an SSL certificate."""
-    try:
-        with open(cert_path, 'rb') as f:
-            cert_data = f.read()
-            cert = x509.load_pem_x509_certificate(cert_data, default_backend())
-
-        # Extract domain names
-        domains = []
-        try:
-            # Get Common Name
-            cn = cert.subject.get_attributes_for_oid(x509.oid.NameOID.COMMON_NAME)[0].value
-            domains.append(cn)
-        except (IndexError, AttributeError):
-            pass
-
-        # Get Subject Alternative Names
-        try:
-            san_ext = cert.extensions.get_extension_for_oid(x509.oid.ExtensionOID.SUBJECT_ALTERNATIVE_NAME)
-            san_domains = [name.value for name in san_ext.value]
-            domains.extend([d for d in san_domains if d not in domains])
-        except x509.ExtensionNotFound:
-            pass
-
-        # Get issuer
-        try:
-            issuer = cert.issuer.get_attributes_for_oid(x509.oid.NameOID.COMMON_NAME)[0].value
-        except (IndexError, AttributeError):
-            issuer = "Unknown"
-
-        # Get expiration info
-        not_before = cert.not_valid_before_utc if hasattr(cert, 'not_valid_before_utc') else cert.not_valid_before
-        not_after = cert.not_valid_after_utc if hasattr(cert, 'not_valid_after_utc') else cert.not_valid_after
-        days_until_expiry = (not_after - datetime.now(not_after.tzinfo)).days
-
-        # Log certificate details
-        logger.info("=" * 70)
-        logger.info("SSL CERTIFICATE DETAILS:")
-        logger.info(f"  Issuer: {issuer}")
-        logger.info(f"  Domains covered ({len(domains)}):")
-        for domain in domains:
-            logger.info(f"    • {domain}")
-        logger.info(f"  Valid from: {not_before.strftime('%Y-%m-%d %H:%M:%S UTC')}")
-        logger.info(f"  Valid until: {not_after.strftime('%Y-%m-%d %H:%M:%S UTC')}")
-        logger.info(f"  Days until expiry: {days_until_expiry}")
-        if days_until_expiry < 30:
-            logger.warning(f"  ⚠️  Certificate expires soon! ({days_until_expiry} days)")
-        logger.info("=" * 70)
-
-    except Exception as e:
-        logger.warning(f"Could not parse certificate details: {e}")
-
-
-def find_ssl_certificates() -> Tuple[str, str]:
-    """
-    Find SSL certificate and key files by checking multiple locations.
-    Returns tuple of (cert_path, key_path).
-
-    Search order:
-    1. /app/ssl/ directory (Docker volume mount)
-    2. ../ssl/ directory (BroFerence/ssl folder - relative to server directory)
-    3. /etc/letsencrypt/live/ directory (Let's Encrypt certs - checks all domains)
-    4. /etc/ssl/ directory (system-wide certs - fallback)
-    """
-    cert_names = ['fullchain.pem', 'cert.pem', 'certificate.pem']
-    key_names = ['privkey.pem', 'key.pem', 'private.pem']
-
-    # Check multiple possible ssl directories
-    ssl_dirs = [
-        Path('/app/ssl'),  # Docker volume mount
-        Path(__file__).parent.parent / 'ssl',  # Relative to script
-    ]
-
-    for ssl_dir in ssl_dirs:
-        logger.info(f"Checking for SSL certificates in: {ssl_dir.absolute()}")
-        if ssl_dir.exists():
-            for cert_name in cert_names:
-                for key_name in key_names:
-                    cert_path = ssl_dir / cert_name
-                    key_path = ssl_dir / key_name
-                    if cert_path.exists() and key_path.exists():
-                        logger.info(f"✓ Found SSL certificates in {ssl_dir}: {cert_name}, {key_name}")
-                        log_certificate_info(str(cert_path.absolute()))
-                        return (str(cert_path.absolute()), str(key_path.absolute()))
-
-    # Location 2: Let's Encrypt directory - check all domain folders
-    letsencrypt_dir = Path('/etc/letsencrypt/live')
-    if letsencrypt_dir.exists():
-        # Find all domain directories
-        try:
-            for domain_dir in letsencrypt_dir.iterdir():
-                if domain_dir.is_dir():
-                    cert_path = domain_dir / 'fullchain.pem'
-                    key_path = domain_dir / 'privkey.pem'
-                    if cert_path.exists() and key_path.exists():
-                        logger.info(f"✓ Found Let's Encrypt certificates for domain: {domain_dir.name}")
-                        log_certificate_info(str(cert_path))
-                        return (str(cert_path), str(key_path))
-        except PermissionError:
-            logger.warning("Permission denied accessing /etc/letsencrypt/live")
-
-    # Location 3: System SSL directory
-    for cert_name in cert_names:
-        for key_name in key_names:
-            cert_path = Path(f'/etc/ssl/certs/{cert_name}')
-            key_path = Path(f'/etc/ssl/private/{key_name}')
-            if cert_path.exists() and key_path.exists():
-                logger.info(f"✓ Found SSL certificates in /etc/ssl/: {cert_name}, {key_name}")
-                log_certificate_info(str(cert_path))
-                return (str(cert_path), str(key_path))
-
-    # Fallback to hardcoded paths (original behavior)
-    logger.warning("No SSL certificates found in standard locations, using fallback paths")
-    return ('/etc/ssl/certs/fullchain.pem', '/etc/ssl/private/privkey.pem')
-
-
 async def main():
     """Start the WebSocket server."""
     host = "0.0.0.0"
@@ -324,9 +341,8 @@ async def main():
     cert_path, key_path = find_ssl_certificates()
 
     # SSL context for WSS
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
     try:
-        ssl_context.load_cert_chain(cert_path, key_path)
+        ssl_context = server_ssl_context(cert_path, key_path)
         logger.info(f"Loaded SSL certificates: {cert_path}, {key_path}")
     except Exception as e:
         logger.error(f"Failed to load SSL certificates: {e}")
@@ -334,9 +350,22 @@ async def main():
 
     logger.info(f"Starting WebRTC signaling server on wss://{host}:{port}")
 
-    async with websockets.serve(handler, host, port, ssl=ssl_context):
+    # Signaling frames are small JSON documents: cap their size well below
+    # the library's 1 MiB default and skip per-message deflate, which costs
+    # more CPU than it saves on payloads this size
+    async with websockets.serve(handler, host, port, ssl=ssl_context,
+                                max_size=MAX_MESSAGE_SIZE, max_queue=32, compression=None):
+        # Parse the certificate for the log once the socket is already
+        # accepting connections, on a thread so the loop keeps serving
+        await asyncio.to_thread(log_certificate_info, cert_path)
         await asyncio.Future()  # Run forever
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Prefer uvloop's libuv-based event loop when it is installed
+    try:
+        import uvloop
+        run = uvloop.run
+    except ImportError:
+        run = asyncio.run
+    run(main())
@@ -4,13 +4,29 @@ YouTube Video Proxy - Extracts and streams video using yt-dlp
 Runs alongside the signaling server on port 8766
 """
 
-import subprocess
+import asyncio
+import functools
+import hashlib
 import logging
+import os
+import time
 import urllib.parse
 import ipaddress
 import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import aiohttp
+import orjson
 from aiohttp import web
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
+
+# Optional: share extractions across restarts and workers through Redis
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,8 +45,98 @@ ALLOWED_DOMAINS = {
     'cloudfront.net',  # Used by many video services
 }
 
+# Redis client backing the extract cache when REDIS_URL is set, else None
+REDIS_CLIENT = web.AppKey('redis_client', object)
+REDIS_KEY_PREFIX = 'ytproxy:extract:'
+REDIS_TIMEOUT = 0.5  # seconds
+
+# Resolved stream hosts: {hostname: (resolved_at, ip_str)}
+_dns_cache: OrderedDict = OrderedDict()
+DNS_CACHE_SIZE = 1024
+DNS_CACHE_TTL = 60  # seconds
+
+# yt-dlp options matching `yt-dlp -f 'best[height<=720]/best' -g --no-warnings --no-playlist`
+YDL_OPTIONS = {
+    'format': 'best[height<=720]/best',
+    'quiet': True,
+    'no_warnings': True,
+    'noplaylist': True,
+    'socket_timeout': 30,
+    'logger': logger,  # Report through our log instead of yt-dlp's own stderr output
+}
+
+# Added to /extract and /stream responses, and all a CORS preflight needs
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Range',
+}
+
+# Health probe reply, encoded once
+HEALTH_BODY = orjson.dumps({'status': 'ok'})
+
+# Extracted stream URLs by page URL: {url: (extracted_at, video_url)}.
+# Signed googlevideo URLs stay valid for hours, well past the TTL
+_extract_cache: OrderedDict = OrderedDict()
+EXTRACT_CACHE_SIZE = 1024
+EXTRACT_CACHE_TTL = 300  # seconds
+
+# Upstream read buffer per stream; chunks are forwarded as the parser fills
+# it, so this bounds the size of each write to the client
+STREAM_READ_BUFSIZE = 1 << 20
+
+# Upstream client session shared by all streams, opened with the app
+CLIENT_SESSION = web.AppKey('client_session', aiohttp.ClientSession)
+
+# yt-dlp runs on its own bounded pool: a timed-out extraction keeps its thread
+# until yt-dlp gives up, and must not starve the default pool that resolves
+# stream hosts. Extractions beyond the pool size are refused, not queued
+EXTRACT_EXECUTOR = web.AppKey('extract_executor', ThreadPoolExecutor)
+EXTRACT_WORKERS = 4
+EXTRACT_TIMEOUT = 30  # seconds
+_extract_slots = threading.BoundedSemaphore(EXTRACT_WORKERS)
+
+
+def json_response(data, status=200):
+    """Build a JSON response, encoded straight to bytes with orjson."""
+    return web.Response(body=orjson.dumps(data), status=status, content_type='application/json', charset='utf-8')
+
+
+def is_allowed_host(hostname):
+    """Check whether a hostname is a whitelisted domain or one of its subdomains."""
+    # Look up each parent domain of the host in the whitelist set, so the
+    # cost depends on the host's label count rather than the whitelist size
+    labels = hostname.split('.')
+    return any('.'.join(labels[i:]) in ALLOWED_DOMAINS for i in range(len(labels)))
+
 
-def is_safe_url(url):
+@functools.lru_cache(maxsize=1024)
+def is_internal_ip(ip_str):
+    """Check whether an address is private, loopback, link-local or reserved."""
+    # Cached: CDN hosts resolve to a small set of addresses, so each one
+    # only goes through ipaddress's range tables once
+    ip = ipaddress.ip_address(ip_str)
+    return ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved
+
+
+async def resolve_host(hostname):
+    """Resolve a hostname to an IPv4 address without blocking the loop, caching briefly."""
+    now = time.monotonic()
+    cached = _dns_cache.get(hostname)
+    if cached and now - cached[0] < DNS_CACHE_TTL:
+        _dns_cache.move_to_end(hostname)
+        return cached[1]
+
+    infos = await asyncio.get_running_loop().getaddrinfo(hostname, None, family=socket.AF_INET)
+    ip_str = infos[0][4][0]
+    _dns_cache[hostname] = (now, ip_str)
+    _dns_cache.move_to_end(hostname)
+    if len(_dns_cache) > DNS_CACHE_SIZE:
+        _dns_cache.popitem(last=False)
+    return ip_str
+
+
+async def is_safe_url(url):
     """
     Validate URL to prevent SSRF attacks.
     Returns (is_safe, error_message)
@@ -49,23 +155,16 @@ def is_safe_url(url):
         hostname = parsed.hostname.lower()
 
         # Check if domain is whitelisted
-        domain_allowed = False
-        for allowed_domain in ALLOWED_DOMAINS:
-            if hostname == allowed_domain or hostname.endswith('.' + allowed_domain):
-                domain_allowed = True
-                break
-
-        if not domain_allowed:
+        if not is_allowed_host(hostname):
             return False, f"Domain not whitelisted: {hostname}"
 
         # Resolve hostname to IP and check if it's private
         try:
             # Get IP address
-            ip_str = socket.gethostbyname(hostname)
-            ip = ipaddress.ip_address(ip_str)
+            ip_str = await resolve_host(hostname)
 
             # Block private/internal IP ranges
-            if ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved:
+            if is_internal_ip(ip_str):
                 return False, f"Private/internal IP address blocked: {ip_str}"
 
             # Block localhost
@@ -83,6 +182,68 @@ def is_safe_url(url):
         return False, f"URL validation error: {e}"
 
 
+def extract_video_url(url):
+    """Resolve a page URL to a direct video URL with yt-dlp; blocking."""
+    # YoutubeDL instances aren't safe to share between threads, but the
+    # module stays imported, so a fresh one per extraction is cheap
+    with YoutubeDL(YDL_OPTIONS) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if info and info.get('entries'):
+        info = next((entry for entry in info['entries'] if entry), None)
+    return info.get('url', '') if info else ''
+
+
+def extract_in_slot(url):
+    """Run extract_video_url, then free the slot taken for it; blocking."""
+    try:
+        return extract_video_url(url)
+    finally:
+        _extract_slots.release()
+
+
+def remember_extraction(url, video_url, now):
+    """Add an extraction to the in-memory cache, evicting the least recently used."""
+    _extract_cache[url] = (now, video_url)
+    _extract_cache.move_to_end(url)
+    if len(_extract_cache) > EXTRACT_CACHE_SIZE:
+        _extract_cache.popitem(last=False)
+
+
+def redis_key(url):
+    """Build the Redis key for a page URL's cached extraction."""
+    return REDIS_KEY_PREFIX + hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+
+
+async def load_shared_extraction(app, url):
+    """Look up an extraction another worker or an earlier run stored in Redis."""
+    redis = app[REDIS_CLIENT]
+    if redis is None:
+        return None
+    try:
+        video_url = await redis.get(redis_key(url))
+    except (aioredis.RedisError, asyncio.TimeoutError) as e:
+        logger.warning("Redis extract cache unavailable: %s", e)
+        return None
+    return video_url.decode() if video_url else None
+
+
+async def store_shared_extraction(app, url, video_url):
+    """Store an extraction in Redis for EXTRACT_CACHE_TTL."""
+    redis = app[REDIS_CLIENT]
+    if redis is None:
+        return
+    try:
+        await redis.setex(redis_key(url), EXTRACT_CACHE_TTL, video_url)
+    except (aioredis.RedisError, asyncio.TimeoutError) as e:
+        logger.warning("Redis extract cache unavailable: %s", e)
+
+
+def stream_url_response(video_url):
+    """Point the client at the stream proxy for an extracted video URL."""
+    encoded_url = urllib.parse.quote(video_url, safe='')
+    return json_response({'url': f'/stream?url={encoded_url}'})
+
+
 async def get_video_url(request):
     """Extract direct video URL from YouTube"""
     try:
@@ -90,32 +251,49 @@ async def get_video_url(request):
         url = data.get('url', '')
 
         if not url:
-            return web.json_response({'error': 'No URL provided'}, status=400)
-
-        logger.info(f"Extracting video URL for: {url}")
-
-        result = subprocess.run(
-            ['yt-dlp', '-f', 'best[height<=720]/best', '-g', '--no-warnings', '--no-playlist', url],
-            capture_output=True, text=True, timeout=30
-        )
-
-        if result.returncode != 0:
-            logger.error(f"yt-dlp error: {result.stderr}")
-            return web.json_response({'error': 'Failed to extract video URL'}, status=500)
+            return json_response({'error': 'No URL provided'}, status=400)
+
+        # Serve repeat requests for the same page without running yt-dlp again
+        now = time.monotonic()
+        cached = _extract_cache.get(url)
+        if cached and now - cached[0] < EXTRACT_CACHE_TTL:
+            _extract_cache.move_to_end(url)
+            return stream_url_response(cached[1])
+
+        # Then for one extracted by another worker or before a restart
+        video_url = await load_shared_extraction(request.app, url)
+        if video_url:
+            remember_extraction(url, video_url, now)
+            return stream_url_response(video_url)
+
+        logger.info("Extracting video URL for: %s", url)
+
+        # Extract in-process on a worker thread, so streams and other
+        # requests keep being served while yt-dlp works. A slot is only freed
+        # when the thread finishes, so timed-out extractions still count
+        if not _extract_slots.acquire(blocking=False):
+            return json_response({'error': 'Too many extractions in progress'}, status=503)
+        loop = asyncio.get_running_loop()
+        extraction = loop.run_in_executor(request.app[EXTRACT_EXECUTOR], extract_in_slot, url)
+        try:
+            video_url = await asyncio.wait_for(extraction, timeout=EXTRACT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return json_response({'error': 'Request timed out'}, status=504)
+        except DownloadError:
+            # yt-dlp has already logged the reason through our logger
+            return json_response({'error': 'Failed to extract video URL'}, status=500)
 
-        video_url = result.stdout.strip()
         if not video_url:
-            return web.json_response({'error': 'No video URL found'}, status=404)
+            return json_response({'error': 'No video URL found'}, status=404)
 
         logger.info("Extracted URL successfully")
-        encoded_url = urllib.parse.quote(video_url, safe='')
-        return web.json_response({'url': f'/stream?url={encoded_url}'})
+        remember_extraction(url, video_url, now)
+        await store_shared_extraction(request.app, url, video_url)
+        return stream_url_response(video_url)
 
-    except subprocess.TimeoutExpired:
-        return web.json_response({'error': 'Request timed out'}, status=504)
     except Exception as e:
-        logger.error(f"Error: {e}")
-        return web.json_response({'error': str(e)}, status=500)
+        logger.error("Error: %s", e)
+        return json_response({'error': str(e)}, status=500)
 
 
 async def stream_video(request):
@@ -125,64 +303,144 @@ async def stream_video(request):
         return web.Response(status=400, text='No URL')
 
     # SECURITY: Validate URL to prevent SSRF attacks
-    is_safe, error_msg = is_safe_url(video_url)
+    is_safe, error_msg = await is_safe_url(video_url)
     if not is_safe:
-        logger.warning(f"Blocked unsafe URL: {error_msg}")
+        logger.warning("Blocked unsafe URL: %s", error_msg)
         return web.Response(status=403, text=f'Forbidden: {error_msg}')
 
-    logger.info(f"Starting video stream proxy for validated URL: {urllib.parse.urlparse(video_url).hostname}")
+    logger.info("Starting video stream proxy for validated URL: %s", urllib.parse.urlparse(video_url).hostname)
 
     try:
-        # Use timeout to prevent hanging requests
-        timeout = aiohttp.ClientTimeout(total=300, connect=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(video_url) as resp:
-                if resp.status != 200:
-                    return web.Response(status=resp.status)
-
-                response = web.StreamResponse(
-                    status=200,
-                    headers={
-                        'Content-Type': resp.headers.get('Content-Type', 'video/mp4'),
-                        'Access-Control-Allow-Origin': '*',
-                        'Cache-Control': 'no-cache',
-                    }
-                )
-                await response.prepare(request)
-
-                async for chunk in resp.content.iter_chunked(65536):
+        session = request.app[CLIENT_SESSION]
+
+        # Pass the player's byte range through so seeks only fetch what they need
+        upstream_headers = {}
+        if 'Range' in request.headers:
+            upstream_headers['Range'] = request.headers['Range']
+
+        async with session.get(video_url, headers=upstream_headers) as resp:
+            if resp.status not in (200, 206):
+                return web.Response(status=resp.status)
+
+            response = web.StreamResponse(
+                status=resp.status,
+                headers={
+                    'Content-Type': resp.headers.get('Content-Type', 'video/mp4'),
+                    'Access-Control-Allow-Origin': '*',
+                    'Cache-Control': 'no-cache',
+                    'Accept-Ranges': 'bytes',
+                }
+            )
+            if 'Content-Range' in resp.headers:
+                response.headers['Content-Range'] = resp.headers['Content-Range']
+            # With a known length the body goes out unframed instead of
+            # chunked; not when aiohttp is decompressing, as the length
+            # would then describe the encoded body
+            if resp.content_length is not None and 'Content-Encoding' not in resp.headers:
+                response.content_length = resp.content_length
+            await response.prepare(request)
+
+            # Forward whatever the parser has buffered as-is rather than
+            # re-slicing it into fixed-size chunks
+            try:
+                async for chunk in resp.content.iter_any():
+                    # Stop pulling from upstream as soon as the viewer goes away
+                    if request.transport is None or request.transport.is_closing():
+                        resp.close()
+                        return response
                     await response.write(chunk)
-
-                await response.write_eof()
+            except ConnectionResetError:
+                logger.info("Client disconnected during stream")
+                resp.close()
                 return response
 
+            await response.write_eof()
+            return response
+
     except Exception as e:
-        logger.error(f"Stream error: {e}")
+        logger.error("Stream error: %s", e)
         return web.Response(status=500, text=str(e))
 
 
 async def health_check(request):
-    return web.json_response({'status': 'ok'})
+    return web.Response(body=HEALTH_BODY, content_type='application/json', charset='utf-8')
+
+
+async def client_session_ctx(app):
+    """Share one pooled upstream session across streams for the app's lifetime."""
+    # Resolve upstream hosts with aiodns when it is installed, instead of
+    # getaddrinfo on the default thread pool
+    try:
+        resolver = aiohttp.AsyncResolver()
+    except RuntimeError:
+        resolver = None
+
+    # Use timeout to prevent hanging requests
+    # sock_read tears down upstreams that stall mid-stream
+    timeout = aiohttp.ClientTimeout(total=300, connect=10, sock_read=30)
+    connector = aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=60, resolver=resolver)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector,
+                                     read_bufsize=STREAM_READ_BUFSIZE) as session:
+        app[CLIENT_SESSION] = session
+        yield
+
+
+async def extract_executor_ctx(app):
+    """Give yt-dlp extractions their own thread pool for the app's lifetime."""
+    executor = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix='yt-dlp')
+    app[EXTRACT_EXECUTOR] = executor
+    try:
+        yield
+    finally:
+        # Don't wait on extractions still running past their timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def redis_ctx(app):
+    """Connect the shared extract cache to Redis when REDIS_URL is configured."""
+    redis_url = os.environ.get('REDIS_URL')
+    if redis_url and aioredis is None:
+        logger.warning("REDIS_URL is set but the redis package is not installed; using in-memory cache only")
+    if not redis_url or aioredis is None:
+        app[REDIS_CLIENT] = None
+        yield
+        return
+
+    # Short timeouts so an unreachable Redis falls back to local extraction
+    redis = aioredis.from_url(redis_url, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT)
+    app[REDIS_CLIENT] = redis
+    try:
+        yield
+    finally:
+        await redis.aclose()
+
+
+def cors(handler):
+    """Add CORS headers to a route handler's responses."""
+    @functools.wraps(handler)
+    async def cors_handler(request):
+        response = await handler(request)
+        response.headers.update(CORS_HEADERS)
+        return response
+    return cors_handler
+
+
+async def cors_preflight(request):
+    return web.Response(headers=CORS_HEADERS)
 
 
 def create_app():
     app = web.Application(client_max_size=0)
 
-    async def cors_middleware(app, handler):
-        async def middleware_handler(request):
-            if request.method == 'OPTIONS':
-                response = web.Response()
-            else:
-                response = await handler(request)
-            response.headers['Access-Control-Allow-Origin'] = '*'
-            response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Range'
-            return response
-        return middleware_handler
+    app.cleanup_ctx.append(client_session_ctx)
+    app.cleanup_ctx.append(extract_executor_ctx)
+    app.cleanup_ctx.append(redis_ctx)
 
-    app.middlewares.append(cors_middleware)
-    app.router.add_post('/extract', get_video_url)
-    app.router.add_get('/stream', stream_video)
+    # CORS only where browsers call in; health probes skip it
+    app.router.add_post('/extract', cors(get_video_url))
+    app.router.add_get('/stream', cors(stream_video))
+    app.router.add_route('OPTIONS', '/extract', cors_preflight)
+    app.router.add_route('OPTIONS', '/stream', cors_preflight)
     app.router.add_get('/health', health_check)
 
     return app
@@ -193,4 +451,11 @@ if __name__ == '__main__':
     print("=" * 60)
     print("YouTube Proxy Server")
     print("=" * 60)
-    web.run_app(app, host='0.0.0.0', port=8766)
+
+    # Prefer uvloop's libuv-based event loop when it is installed
+    try:
+        import uvloop
+        loop = uvloop.new_event_loop()
+    except ImportError:
+        loop = None
+    web.run_app(app, host='0.0.0.0', port=8766, loop=loop)
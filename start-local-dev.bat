@@ -15,7 +15,7 @@ if errorlevel 1 (
 
 echo [1/3] Installing Python dependencies...
 cd server
-pip install websockets >nul 2>&1
+pip install -r requirements.txt >nul 2>&1
 if errorlevel 1 (
     echo WARNING: Could not install dependencies. Trying anyway...
 )
@@ -14,7 +14,7 @@ fi
 
 echo "[1/3] Installing Python dependencies..."
 cd server
-pip3 install websockets > /dev/null 2>&1
+pip3 install -r requirements.txt > /dev/null 2>&1
 if [ $? -ne 0 ]; then
     echo "WARNING: Could not install dependencies. Trying anyway..."
 fi